@@ -1,12 +1,27 @@
-from json import load as load_json
-from Utils import Notifier, get_logger, DatabaseManager
+from functools import lru_cache
+from Utils import Notifier, get_logger, DatabaseManager, load_config
 from os import getcwd, path, listdir
 from time import sleep
 
+# lookup table over all 64 possible sensor values, holding a 1 where the ones of the value
+# form a closed block from the bottom sensor upwards (-> no sensor is skipped)
+_VALID_LUT = bytes(1 if value in (0b000000, 0b000001, 0b000011, 0b000111, 0b001111, 0b011111, 0b111111) else 0 for value in range(64))
+
+
+@lru_cache(maxsize=128)
+def _water_level_for(levels_rev: tuple, bit_value: str):
+    """ Get the water level name for a bit-value. Pure over the 64 possible inputs, so results are cached. """
+    if len(bit_value) != 6 or bit_value.strip("01") != "":
+        return None
+    value = int(bit_value, 2)
+    # the level index is the number of ones sitting in a row at the bottom of the value
+    index = ((value + 1) & ~value).bit_length() - 1
+    return levels_rev[index]
+
 
 class App:
     def __init__(self, default: str = "111111", **kwargs):
-        projekt_root_dir = path.dirname(path.dirname(path.dirname(getcwd())))
+        projekt_root_dir = path.abspath(path.join(getcwd(), "..", "..", ".."))
         config_path = path.join(projekt_root_dir, kwargs.get("config_location", "src/resources/config.json"))
         log_file_path = path.join(projekt_root_dir, kwargs.get("logfile_location", "appdata/app.log"))
         database_path = path.join(projekt_root_dir, kwargs.get("database_location", "appdata/messwerte.db"))
@@ -14,14 +29,23 @@ class App:
         assert "main.py" in listdir(getcwd()), "Programm can only be executed from the folder it lies in itself!"
         assert path.isfile(config_path), "No config-file found! Check out the README.md of this Project inside 'school/BFK-7_Projektaufgabe/README.md'"
 
-        # load my config from my json file
-        with open(config_path, "r", encoding="utf-8") as file:
-            self.config: dict[list | str, str | dict[str, str | int]] = load_json(file)
+        # load my config from my json file (the parsed dict is cached between runs)
+        self.config: dict[list | str, str | dict[str, str | int]] = load_config(config_path)
+
+        # cache the config entries used on every mainloop iteration as attributes,
+        # so the hot path does not rebuild lists or walk nested dicts again and again
+        self._levels_rev = tuple(reversed(self.config["WATER_LEVEL_NAMES"]))
+        self._delays = self.config["DELAYS"]
+        self._messages = self.config["NOTIFICATION_MESSAGES"]
+        self._sensor_names = self.config["SENSOR_NAMES"]
+        self._notify_above = set(self.config["NOTIFICATION_WHEN_RISEN_ABOVE"])
 
         self.default_value = default
         self.active_value = default
+        # the active value is also kept as an int, so the bit-math does not have to re-parse the string
+        self.active_int = int(default, 2)
         self.water_level = self.get_water_level(self.active_value)
-        self.triggered_water_areas = []
+        self.triggered_water_areas = set()
         self.log = get_logger(self.__class__.__name__, log_file_path)
         self.database = DatabaseManager(database_path, log_file_path, kwargs.get("database_table", "messwerte"))
         self.notifier = Notifier(
@@ -33,36 +57,40 @@ class App:
             server="smtp.gmail.com"
         )
 
+        # command name -> handler, one hash lookup instead of comparing the
+        # token against every known command name
+        self._cmd_table = {
+            "help": self._cmd_help,
+            "exit": self._cmd_exit,
+            "clear": self.database.delete_all_entries,
+            "notify": self.database_notification,
+            "reset": self._cmd_reset,
+        }
+
     def get_water_level(self, bit_value: str):
         """ Get the current water level by the bits from the water tank sensors. """
-        if len(bit_value) != 6 or not all(x in "01" for x in bit_value):
-            return None
-        index = 0
-        for bit in bit_value[::-1]:
-            if bit != "1":
-                break
-            index += 1
-        return self.config["WATER_LEVEL_NAMES"][::-1][index]
+        return _water_level_for(self._levels_rev, bit_value)
 
     @staticmethod
+    @lru_cache(maxsize=128)
     def validate_bit_value(bit_value: str):
         """ Returns a bool, validating if a bit-string is usable and has no errors. """
-        if len(bit_value) != 6 or not all(x in "01" for x in bit_value):
+        if len(bit_value) != 6 or bit_value.strip("01") != "":
             return False
 
-        if "1" in bit_value:
-            if "0" in bit_value[bit_value.index("1")::]:
-                return False
-
-        return True
+        return _VALID_LUT[int(bit_value, 2)] == 1
 
     def get_failing_sensor_name(self, bit_value: str):
         """ Get the name of the sensor that is failing by the bit-string of the sensors. """
-        # no sensor signal of 1 is missing
-        if "0" not in bit_value.strip("0"):
+        value = int(bit_value, 2)
+        # drop the zeros at the bottom, a sensor only fails when a zero sits between two ones
+        stripped = value >> ((value & -value).bit_length() - 1) if value else 0
+        if stripped & (stripped + 1) == 0:
+            # no sensor signal of 1 is missing
             return None
 
-        return self.config["SENSOR_NAMES"][bit_value.rindex("0")]
+        # the failing sensor is the lowest zero bit, meaning the rightmost "0" in the bit-string
+        return self._sensor_names[5 - (((value + 1) & ~value).bit_length() - 1)]
 
     def database_notification(self):
         total_wait_time = 0
@@ -71,50 +99,48 @@ class App:
         for entry in self.database.count_entries_by_level():
             level_name = entry[0]
             count = entry[1]
-            if level_name in self.config["WATER_LEVEL_NAMES"]:
-                wait_time = (self.config["DELAYS"][level_name]) / 60
+            if level_name in self._levels_rev:
+                wait_time = self._delays[level_name] / 60
                 total_wait_time += wait_time
                 email_message += f"\nAnzahl der Messwerte in {level_name}: {count:03d} --- {wait_time} min."
             elif level_name == "ERROR":
                 email_message += f"\nAnzahl der Fehlermesswerte: {count:03d}"
             else:
-                self.log.warning(f"Detected a entry wich can not be assigned ({count} times): {level_name}")
+                self.log.warning("Detected a entry wich can not be assigned (%s times): %s", count, level_name)
 
         email_message += f"\nGesamte Messzeit: {int(total_wait_time / 60)} h - {total_wait_time % 60} min"
         self.database.delete_all_entries()
         self.notifier.send_email(subject="Report", message=email_message)
 
+    @staticmethod
+    def _cmd_help():
+        print("##################################################################")
+        print("## HELP MENU")
+        print("## exit    - stop the programm")
+        print("## clear   - clear the database")
+        print("## notify  - send a notification about your database")
+        print("## reset   - reset current user inputs to the default")
+        print("## help    - show the help menu")
+        print("##################################################################")
+
+    @staticmethod
+    def _cmd_exit():
+        raise KeyboardInterrupt
+
+    def _cmd_reset(self):
+        self.triggered_water_areas.clear()
+        self.active_value = self.default_value
+        self.active_int = int(self.default_value, 2)
+        self.water_level: str = self.get_water_level(self.active_value)
+
     def handle_commands(self, commands: list[str]):
         """ Execute commands given in the commands list. Returns True when one was executed """
         command_executed = False
         for command in commands:
-            if command == "help":
-                print("##################################################################")
-                print("## HELP MENU")
-                print("## exit    - stop the programm")
-                print("## clear   - clear the database")
-                print("## notify  - send a notification about your database")
-                print("## reset   - reset current user inputs to the default")
-                print("## help    - show the help menu")
-                print("##################################################################")
-                command_executed = True
-
-            if command == "exit":
-                raise KeyboardInterrupt
-
-            if command == "clear":
-                command_executed = True
-                self.database.delete_all_entries()
-
-            if command == "notify":
-                command_executed = True
-                self.database_notification()
-
-            if command == "reset":
+            handler = self._cmd_table.get(command)
+            if handler is not None:
+                handler()
                 command_executed = True
-                self.triggered_water_areas.clear()
-                self.active_value = self.default_value
-                self.water_level: str = self.get_water_level(self.active_value)
 
         return command_executed
 
@@ -123,9 +149,6 @@ class App:
         self.log.info("App starting up ...")
         while True:
 
-            # sleep a shot time in case the logger flushes to late in the console
-            sleep(0.1)
-
             # user input with a display wich displays the current value and water area
             user_input = input(f"({self.water_level}: {self.active_value}) | &> ").lower().strip()
 
@@ -133,49 +156,58 @@ class App:
             if self.handle_commands([x.strip() for x in user_input.split()]):
                 continue
 
+            # parse the input to an int once per iteration, everything below works with this value
+            try:
+                new_int = int(user_input, 2)
+            except ValueError:
+                new_int = -1
+
             # a bool needed to detect if there were multiple bits or just one changed. when there a multiple changed,
             # it should not work due to the condition that the user cant put in a value that skips a sensor
-            one_bit_changed = len([True for old_bit, new_bit in zip(self.active_value, user_input) if old_bit != new_bit]) <= 1
+            one_bit_changed = new_int >= 0 and (new_int ^ self.active_int).bit_count() <= 1
 
             # triggered when the bit-value is usable and is either smaller or higher by one than the current value
-            if self.validate_bit_value(user_input) and (one_bit_changed or (one_bit_changed and int(user_input, 2) >= int(self.active_value, 2))):
+            if self.validate_bit_value(user_input) and one_bit_changed:
+                old_int = self.active_int
                 self.active_value = user_input
+                self.active_int = new_int
                 self.water_level = self.get_water_level(self.active_value)
                 self.database.add_entry(self.water_level)
 
                 # when the user enters a higher value (meaning the water was filled up)
-                if int(user_input, 2) > int(self.active_value, 2):
+                if new_int > old_int:
                     self.triggered_water_areas.clear()
 
                     # when the water level rises above a defined level, send a notification
-                    if self.water_level in self.config["NOTIFICATION_WHEN_RISEN_ABOVE"]:
+                    if self.water_level in self._notify_above:
                         # self.database_notification()
                         # dont trigger the database notification, because this is exersice 1
                         pass
 
                 # when the notification for the area was not sent already, send an email
                 if self.water_level not in self.triggered_water_areas:
-                    self.notifier.send_email(message=f"Status:\n{self.config['NOTIFICATION_MESSAGES'][self.water_level]}")
-                    self.triggered_water_areas.append(self.water_level)
+                    self.notifier.send_email(message=f"Status:\n{self._messages[self.water_level]}")
+                    self.triggered_water_areas.add(self.water_level)
 
-                sleep(self.config["DELAYS"][self.water_level])
+                sleep(self._delays[self.water_level])
 
             # triggered when it is not a valid bit value (example 010111) but can be ordered to a water-level
             # this means a sensor is failing and not working properly
             elif not self.validate_bit_value(user_input) and self.get_water_level(user_input) is not None:
-                self.log.warning(f"Sensor {self.get_failing_sensor_name(user_input)} is not working properly! Sensor send a value of '{user_input}'")
+                failing_sensor = self.get_failing_sensor_name(user_input)
+                self.log.warning("Sensor %s is not working properly! Sensor send a value of '%s'", failing_sensor, user_input)
                 self.notifier.send_email(
                     subject="Sensor not working properly!",
-                    message=f"Sensor {self.get_failing_sensor_name(user_input)} is not working properly!\nSensor send a value of '{user_input}'"
+                    message=f"Sensor {failing_sensor} is not working properly!\nSensor send a value of '{user_input}'"
                 )
                 self.database.add_entry("ERROR")
-                sleep(self.config["DELAYS"]["PB0"])
+                sleep(self._delays["PB0"])
 
             # when the change of the value is not allowed or the value has a wrong format
             else:
-                self.log.error(f"Could not set value from '{self.active_value}' to '{user_input}'!")
+                self.log.error("Could not set value from '%s' to '%s'!", self.active_value, user_input)
                 self.database.add_entry("ERROR")
-                sleep(self.config["DELAYS"]["PB0"])
+                sleep(self._delays["PB0"])
 
 
 if __name__ == '__main__':
@@ -1,21 +1,92 @@
+import atexit
 import logging
 import logging.handlers
+import os
+import pickle
+import queue
 import smtplib
+import threading
 from email.mime.text import MIMEText
+from json import load as load_json
 import sqlite3
-from datetime import datetime
+from time import localtime, strftime
 
+# orjson parses json several times faster than the stdlib, but is optional
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """ RotatingFileHandler that keeps an approximate byte counter of the log file,
+    so shouldRollover can skip the filesystem check while the file is clearly below maxBytes. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        try:
+            self._approx_size = os.path.getsize(self.baseFilename)
+        except OSError:
+            self._approx_size = 0
+
+    def shouldRollover(self, record):
+        msg_len = len(self.format(record)) + 1
+        # fast path: while the counter is clearly below maxBytes the file can not need a rollover
+        if self.maxBytes > 0 and self._approx_size + msg_len < self.maxBytes:
+            self._approx_size += msg_len
+            return False
+
+        if super().shouldRollover(record):
+            self._approx_size = 0
+            return True
+
+        # resync the counter with the real file size for the next fast-path checks
+        if self.stream is not None:
+            self._approx_size = self.stream.tell()
+        return False
+
+
+def load_config(config_path: str) -> dict:
+    """ Load a json config file. The parsed dict is kept in a pickle sidecar next to the config,
+    wich is reused on the next startup as long as the config file itself was not modified. """
+    cache_path = config_path + ".pkl"
+    try:
+        if os.path.getmtime(cache_path) >= os.path.getmtime(config_path):
+            with open(cache_path, "rb") as file:
+                return pickle.load(file)
+    except Exception:
+        pass  # no usable (or a corrupted) cache, parse the json below
+
+    if orjson is not None:
+        with open(config_path, "rb") as file:
+            config = orjson.loads(file.read())
+    else:
+        with open(config_path, "r", encoding="utf-8") as file:
+            config = load_json(file)
+
+    try:
+        with open(cache_path, "wb") as file:
+            pickle.dump(config, file)
+    except OSError:
+        pass  # the cache is only an optimization, the config itself was loaded fine
+
+    return config
 
 
 def get_logger(thread_name: str, file_name: str) -> logging.Logger:
     # Create a custom logger
     logger = logging.getLogger(thread_name)
 
+    # logging.getLogger returns the same logger for the same name, so attaching
+    # handlers again would write every record twice (or more) into file and console
+    if logger.handlers:
+        return logger
+
     # Set level of logger
     logger.setLevel(logging.INFO)
 
     # Create handlers
-    central_handler = logging.handlers.RotatingFileHandler(file_name, maxBytes=10240000, encoding="UTF-8", backupCount=10)
+    central_handler = FastRotatingFileHandler(file_name, maxBytes=10240000, encoding="UTF-8", backupCount=10)
     stream_handler = logging.StreamHandler()
 
     # Create formatter
@@ -27,8 +98,16 @@ def get_logger(thread_name: str, file_name: str) -> logging.Logger:
     stream_handler.setFormatter(stream_formatter)
 
     # Add handlers to the logger
-    logger.addHandler(central_handler)
-    logger.addHandler(stream_handler)
+    # INFO records get buffered in memory and flushed to disk in batches,
+    # WARNING and above (sensor failures etc.) still flush immediately
+    memory_handler = logging.handlers.MemoryHandler(512, flushLevel=logging.WARNING, target=central_handler, flushOnClose=True)
+    atexit.register(memory_handler.flush)
+    logger.addHandler(memory_handler)
+
+    # console logging is opt-in (set APP_CONSOLE_LOG=1), writing every record to the
+    # terminal is slow and clutters the input prompt of the mainloop
+    if os.getenv("APP_CONSOLE_LOG", "0") == "1":
+        logger.addHandler(stream_handler)
 
     return logger
 
@@ -43,11 +122,55 @@ class Notifier:
         self.server_port = kwargs.get("port", 587)
         self.server_url = kwargs.get("server", "smtp.gmail.com")
 
+        # the smtp connection is kept open between send_email calls, because connect + starttls + login
+        # takes multiple seconds and would otherwise be payed on every single notification
+        self._smtp = None
+
+        # emails are sent from a background thread, so the mainloop does not block
+        # on the network while it is sleeping or waiting for user input
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._send_worker, name=self.__class__.__name__, daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        """ Open a new connection to the smtp server and login. """
+        self._smtp = smtplib.SMTP(self.server_url, self.server_port)
+        self._smtp.starttls()  # Start a secure connection with TLS encryption
+        self._smtp.login(self.sender_email_address, self.sender_email_passwd)  # Login to the email account
+
+    def close(self):
+        """ Stop the sender thread and close the smtp connection. Gets called automatically at app shutdown. """
+        if self._worker.is_alive():
+            # let the worker drain the queued emails, then stop it
+            self._queue.put(None)
+            self._worker.join(timeout=30)
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass  # the server may have dropped the connection already
+        self._smtp = None
+
     def send_email(self, **kwargs):
         # default subject and message if not provided
         subject = kwargs.get("subject", "Cistern Notification (Automation)")
         message_body = kwargs.get("message", "Look after your Water!")
-        self.log.info(f"Sending email to {self.receiver_email_address} >>> {message_body.splitlines()}")
+
+        # only hand the email over to the sender thread, so the caller does not wait on the network
+        self._queue.put((subject, message_body))
+
+    def _send_worker(self):
+        """ Background thread that sends the queued emails one by one. """
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._send_now(*item)
+
+    def _send_now(self, subject: str, message_body: str):
+        self.log.info("Sending email to %s >>> %s", self.receiver_email_address, message_body.splitlines())
 
         # create a plain text email message
         msg = MIMEText(message_body)  # MIMEText is used for plain text messages
@@ -56,13 +179,16 @@ class Notifier:
         msg["Subject"] = subject
 
         try:
-            # connect to the Gmail SMTP server using `with ... as` for proper resource handling
-            with smtplib.SMTP(self.server_url, self.server_port) as server:
-                server.starttls()  # Start a secure connection with TLS encryption
-                server.login(self.sender_email_address, self.sender_email_passwd)  # Login to the email account
-                server.sendmail(self.sender_email_address, self.receiver_email_address, msg.as_string())  # Send the email
+            # check if the open connection is still alive, reconnect when it is not
+            try:
+                if self._smtp is None or self._smtp.noop()[0] != 250:
+                    self._connect()
+            except (smtplib.SMTPServerDisconnected, OSError):
+                self._connect()
+
+            self._smtp.sendmail(self.sender_email_address, self.receiver_email_address, msg.as_string())  # Send the email
         except Exception as e:
-            self.log.error(f"Could not send email to {self.receiver_email_address} due to '{e}'")
+            self.log.error("Could not send email to %s due to '%s'", self.receiver_email_address, e)
             return
 
         # log that the email was sent successfully
@@ -74,11 +200,30 @@ class DatabaseManager:
         self.db_name = db_name
         self.table_name = table_name
         self.log = get_logger(self.__class__.__name__, log_file_path)
+
+        # one connection for the lifetime of the manager, opening the database file
+        # on every query would cost a file open and a full fsync per written row
+        self._conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._cursor = self._conn.cursor()
+        # the insert statement runs for every single measurement, so build it once
+        self._insert_sql = f"INSERT INTO {self.table_name} (level, timestamp) VALUES (?, ?)"
+        atexit.register(self.close)
+
         self._initialize_database()
 
+    def close(self):
+        """ Close the database connection. Gets called automatically at app shutdown. """
+        if self._conn is None:
+            return
+        self._conn.commit()
+        self._conn.close()
+        self._conn = None
+
     def _initialize_database(self):
         """Create the database and table if they do not exist."""
-        self.log.info(f"Initializing the database with table '{self.table_name}'.")
+        self.log.info("Initializing the database with table '%s'.", self.table_name)
         self.execute(f'''
            CREATE TABLE IF NOT EXISTS {self.table_name} (
                id INTEGER PRIMARY KEY,
@@ -86,41 +231,46 @@ class DatabaseManager:
                timestamp TEXT
            )
        ''', commit=True)
+        # count_entries_by_level and delete_entries_by_level filter on level, the index
+        # keeps them from scanning the whole table wich only ever grows between reports
+        self.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table_name}_level ON {self.table_name}(level)", commit=True)
 
     def execute(self, sql: str, params: tuple = (), commit: bool = False):
         """Execute a SQL query with optional parameters."""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute(sql, params)
         if commit:
-            conn.commit()
-            self.log.debug(f"Executed SQL with commit: {[x.strip() for x in sql.splitlines()]}")
+            # the connection context manager commits on success and rolls back on errors
+            with self._conn:
+                self._cursor.execute(sql, params)
+            self.log.debug("Executed SQL with commit: %s", [x.strip() for x in sql.splitlines()])
         else:
-            self.log.debug(f"Executed SQL: {[x.strip() for x in sql.strip().splitlines()]}")
-        rows = cursor.fetchall()
-        conn.close()
-        return rows
+            self._cursor.execute(sql, params)
+            self.log.debug("Executed SQL: %s", [x.strip() for x in sql.strip().splitlines()])
+        return self._cursor.fetchall()
 
     def add_entry(self, level: str):
         """Add a new measurement entry."""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.execute(
-            f"INSERT INTO {self.table_name} (level, timestamp) VALUES (?, ?)",
-            (level, timestamp),
-            commit=True
-        )
-        self.log.info(f"Added entry: {level} at {timestamp}")
+        timestamp = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        with self._conn:
+            self._cursor.execute(self._insert_sql, (level, timestamp))
+        self.log.info("Added entry: %s at %s", level, timestamp)
+
+    def add_entries(self, levels: list[str]):
+        """Add multiple measurement entries in one transaction."""
+        timestamp = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        with self._conn:
+            self._cursor.executemany(self._insert_sql, [(level, timestamp) for level in levels])
+        self.log.info("Added %s entries at %s", len(levels), timestamp)
 
     def read_all_entries(self):
         """Read all measurement entries."""
         rows = self.execute(f"SELECT * FROM {self.table_name}")
-        self.log.info(f"Read {len(rows)} entries from the database.")
+        self.log.info("Read %s entries from the database.", len(rows))
         return rows
 
     def read_last_entries(self, count: int):
         """Read the last N measurement entries."""
         rows = self.execute(f"SELECT * FROM {self.table_name} ORDER BY id DESC LIMIT ?", (count,))
-        self.log.info(f"Read the last {count} entries.")
+        self.log.info("Read the last %s entries.", count)
         return rows
 
     def delete_all_entries(self):
@@ -131,7 +281,7 @@ class DatabaseManager:
     def delete_entries_by_level(self, level: str):
         """Delete entries for a specific level."""
         self.execute(f"DELETE FROM {self.table_name} WHERE level = ?", (level,), commit=True)
-        self.log.warning(f"Deleted all entries with level: {level}")
+        self.log.warning("Deleted all entries with level: %s", level)
 
     def count_entries_by_level(self):
         """Count the number of entries per level."""